@@ -1,50 +1,153 @@
 # AutomataTheory.py
-from os import popen
+from array import array
+from bisect import bisect_left
 import shutil
+import subprocess
+
+try:
+    import numpy as np
+    from numba import njit
+except ImportError:
+    njit = None
+
+
+if njit is not None:
+    @njit(cache=True)
+    def _simulate(codes, table, start, finals):
+        # table[q, c] lists the e-free targets of state q on symbol c, -1 terminated
+        n = finals.shape[0]
+        current = np.zeros(n, dtype=np.bool_)
+        nextstates = np.zeros(n, dtype=np.bool_)
+        current[start] = True
+        for c in codes:
+            nextstates[:] = False
+            reached = False
+            for q in range(n):
+                if current[q]:
+                    for j in range(table.shape[2]):
+                        t = table[q, c, j]
+                        if t < 0:
+                            break
+                        nextstates[t] = True
+                        reached = True
+            if not reached:
+                return False
+            current, nextstates = nextstates, current
+        for q in range(n):
+            if current[q] and finals[q]:
+                return True
+        return False
+
 
 class Automata:
     """class to represent an Automata"""
 
+    # most DFA states kept by step() before the cache is flushed, and the most compile_simulator
+    # will hardcode
+    DFA_LIMIT = 256
+
+    __slots__ = ('states', 'startstate', 'finalstates', 'transitions', 'language',
+                 '_eclosure', 'eps_adj', '_dfa_cache', '_epsfree', '_start_bits', '_final_bits',
+                 'sym_index', '_simtables', 'simulator', 'frozen', 'symbols', '_csr')
+
     def __init__(self, language = set(['0', '1'])):
         self.states = set()
         self.startstate = None
-        self.finalstates = []
+        self.finalstates = set()
         self.transitions = dict()
         self.language = language
+        self._eclosure = dict()
+        self.eps_adj = None
+        self._dfa_cache = dict()
+        self._epsfree = None
+        self._start_bits = 0
+        self._final_bits = 0
+        self.sym_index = dict()
+        self._simtables = None
+        self.simulator = None
+        self.frozen = False
+        self.symbols = []
+        self._csr = None
 
     @staticmethod
     def epsilon():
         return ":e:"
 
     def setstartstate(self, state):
+        self._invalidate()
         self.startstate = state
         self.states.add(state)
 
     def addfinalstates(self, state):
         if isinstance(state, int):
             state = [state]
-        for s in state:
-            if s not in self.finalstates:
-                self.finalstates.append(s)
+        self.finalstates.update(state)
+        self._invalidate()
 
     def addtransition(self, fromstate, tostate, inp):
-        if isinstance(inp, str):
-            inp = set([inp])
         self.states.add(fromstate)
         self.states.add(tostate)
-        if fromstate in self.transitions:
-            if tostate in self.transitions[fromstate]:
-                self.transitions[fromstate][tostate] = self.transitions[fromstate][tostate].union(inp)
-            else:
-                self.transitions[fromstate][tostate] = inp
+        self._invalidate()
+        tostates = self.transitions.setdefault(fromstate, {})
+        chars = tostates.get(tostate)
+        if chars is None:
+            tostates[tostate] = set([inp]) if isinstance(inp, str) else set(inp)
+        elif isinstance(inp, str):
+            chars.add(inp)
         else:
-            self.transitions[fromstate] = {tostate : inp}
+            chars |= inp
 
     def addtransition_dict(self, transitions):
         for fromstate, tostates in transitions.items():
             for state in tostates:
                 self.addtransition(fromstate, state, tostates[state])
 
+    def freeze(self):
+        """runs all precomputation and packs the transitions into read-only CSR arrays:
+        the edges of the i-th state of sorted(states) are indptr[i]:indptr[i + 1] of
+        indices (target state) and symidx (index into symbols); afterwards any change raises"""
+        self.precompute_symindex()
+        self.precompute_eclosures()
+        self.precompute_bitsets()
+        order = sorted(self.states)
+        indptr = array('i', [0])
+        indices = array('i')
+        symidx = array('i')
+        for state in order:
+            for tostate, chars in sorted(self.transitions.get(state, {}).items()):
+                for char in sorted(chars, key=self.sym_index.get):
+                    indices.append(tostate)
+                    symidx.append(self.sym_index[char])
+            indptr.append(len(indices))
+        self.symbols = sorted(self.sym_index, key=self.sym_index.get)
+        self._csr = (order, indptr, indices, symidx)
+        self.frozen = True
+
+    def getedges(self, state=None):
+        """returns the (fromstate, tostate, char) edges of state, or of every state"""
+        if not self.frozen:
+            rows = self.transitions.items() if state is None else [(state, self.transitions.get(state, {}))]
+            return [(fromstate, tostate, char)
+                    for fromstate, tostates in rows for tostate, chars in tostates.items() for char in chars]
+        order, indptr, indices, symidx = self._csr
+        if state is None:
+            rows = range(len(order))
+        elif state in self.states:
+            rows = [bisect_left(order, state)]
+        else:
+            rows = []
+        symbols = self.symbols
+        return [(order[i], indices[k], symbols[symidx[k]]) for i in rows for k in range(indptr[i], indptr[i + 1])]
+
+    def precompute_symindex(self):
+        """numbers the language symbols, then epsilon and any other symbol used on an edge"""
+        index = {char: i for i, char in enumerate(sorted(self.language) + [Automata.epsilon()])}
+        for tostates in self.transitions.values():
+            for chars in tostates.values():
+                for char in chars:
+                    index.setdefault(char, len(index))
+        self.sym_index = index
+
     def gettransitions(self, state, key):
         if isinstance(state, int):
             state = [state]
@@ -56,22 +159,245 @@ class Automata:
                         trstates.add(tns)
         return trstates
 
+    def _invalidate(self):
+        if self.frozen:
+            raise BaseException("Automata is frozen and cannot be modified")
+        self._eclosure.clear()
+        self.eps_adj = None
+        self._dfa_cache.clear()
+        self._epsfree = None
+        self._simtables = None
+        self.simulator = None
+
+    @staticmethod
+    def tobits(states):
+        bits = 0
+        for state in states:
+            bits |= 1 << state
+        return bits
+
+    @staticmethod
+    def frombits(bits):
+        states = []
+        while bits:
+            low = bits & -bits
+            states.append(low.bit_length() - 1)
+            bits ^= low
+        return states
+
+    def precompute_bitsets(self):
+        """builds the e-free NFA as int bitsets (bit s for state s); transitions keeps the e-nfa for display"""
+        adj = dict()
+        for fromstate, tostates in self.transitions.items():
+            for state, chars in tostates.items():
+                for char in chars:
+                    if char != Automata.epsilon():
+                        row = adj.setdefault(char, dict())
+                        row[fromstate] = row.get(fromstate, 0) | 1 << state
+        eclosure_bits = {state: Automata.tobits(self.getEClose(state)) for state in self.states}
+        epsfree = dict()
+        for char, row in adj.items():
+            closed = dict()
+            for fromstate, bits in row.items():
+                for state in Automata.frombits(bits):
+                    closed[fromstate] = closed.get(fromstate, 0) | eclosure_bits[state]
+            epsfree[char] = erow = dict()
+            for state in self.states:
+                bits = 0
+                for s in self.getEClose(state):
+                    bits |= closed.get(s, 0)
+                if bits:
+                    erow[state] = bits
+        self._start_bits = 1 << self.startstate
+        self._final_bits = Automata.tobits(state for state in self.states
+                                           if not self.getEClose(state).isdisjoint(self.finalstates))
+        self._epsfree = epsfree
+
+    def step(self, states, char):
+        """returns the bitset of states the e-free NFA reaches from the bitset states on char"""
+        row = self._dfa_cache.get(states)
+        if row is None:
+            if len(self._dfa_cache) >= Automata.DFA_LIMIT:
+                self._dfa_cache.clear()
+            row = self._dfa_cache[states] = dict()
+        elif char in row:
+            return row[char]
+        if self._epsfree is None:
+            self.precompute_bitsets()
+        epsfree = self._epsfree.get(char, {})
+        nextstates = 0
+        for state in Automata.frombits(states):
+            nextstates |= epsfree.get(state, 0)
+        row[char] = nextstates
+        return nextstates
+
+    def subsetdfa(self, limit):
+        """explores the DFA of the e-free NFA from the start state; returns its transition rows
+        (char -> DFA state number, 0 is the start) and accepting numbers, or None past limit states"""
+        if self._epsfree is None:
+            self.precompute_bitsets()
+        number = {self._start_bits: 0}
+        subsets = [self._start_bits]
+        rows = []
+        for current in subsets:
+            row = dict()
+            for char in sorted(self.language):
+                nextstates = self.step(current, char)
+                if not nextstates:
+                    continue
+                if nextstates not in number:
+                    if len(subsets) == limit:
+                        return None
+                    number[nextstates] = len(subsets)
+                    subsets.append(nextstates)
+                row[char] = number[nextstates]
+            rows.append(row)
+        accepting = [i for i, subset in enumerate(subsets) if subset & self._final_bits]
+        return [rows, accepting]
+
+    def precompute_simtables(self):
+        """builds the dense int32 form of the e-free NFA used by the numba simulator"""
+        if self._epsfree is None:
+            self.precompute_bitsets()
+        order = sorted(self.states)
+        pos = {state: i for i, state in enumerate(order)}
+        codes = {char: i for i, char in enumerate(sorted(self.language))}
+        targets = [[[] for _ in codes] for _ in order]
+        for char, row in self._epsfree.items():
+            if char in codes:
+                for state, bits in row.items():
+                    targets[pos[state]][codes[char]] = [pos[t] for t in Automata.frombits(bits)]
+        width = max([len(t) for row in targets for t in row], default=0) + 1
+        table = np.full((len(order), len(codes), width), -1, dtype=np.int32)
+        for q, row in enumerate(targets):
+            for c, t in enumerate(row):
+                table[q, c, :len(t)] = t
+        finals = np.array([bool(self._final_bits >> state & 1) for state in order], dtype=np.bool_)
+        self._simtables = (codes, table, pos[self.startstate], finals)
+
+    def accepts(self, string):
+        return self.accepts_many([string])[0]
+
+    def accepts_many(self, strings):
+        """tests every string against the automaton, setting up the simulator only once"""
+        if self.simulator is not None:
+            return list(map(self.simulator, strings))
+        if njit is not None:
+            # only reached when compile_simulator gave up on a large DFA
+            if self._simtables is None:
+                self.precompute_simtables()
+            codes, table, start, finals = self._simtables
+            results = []
+            for string in strings:
+                if not codes.keys() >= set(string):
+                    results.append(False)
+                    continue
+                inp = np.fromiter((codes[char] for char in string), dtype=np.uint8, count=len(string))
+                results.append(_simulate(inp, table, start, finals))
+            return results
+        if self._epsfree is None:
+            self.precompute_bitsets()
+        start = self._start_bits
+        finals = self._final_bits
+        cache = self._dfa_cache
+        results = []
+        for string in strings:
+            current = start
+            for char in string:
+                row = cache.get(current)
+                if row is not None and char in row:
+                    current = row[char]
+                else:
+                    current = self.step(current, char)
+                if not current:
+                    break
+            results.append(bool(current & finals))
+        return results
+
+    def precompute_epsadj(self):
+        eps_adj = {state: [] for state in self.states}
+        for fromstate, tostates in self.transitions.items():
+            for state, chars in tostates.items():
+                if Automata.epsilon() in chars:
+                    eps_adj[fromstate].append(state)
+        self.eps_adj = eps_adj
+
+    def precompute_eclosures(self):
+        """computes all e-closures in one pass of Tarjan's algorithm over the e-edges;
+        states of one strongly connected component share a single closure frozenset"""
+        if self.eps_adj is None:
+            self.precompute_epsadj()
+        eps_adj = self.eps_adj
+        index = dict()
+        lowlink = dict()
+        onstack = set()
+        stack = []
+        eclosure = dict()
+        for root in self.states:
+            if root in index:
+                continue
+            index[root] = lowlink[root] = len(index)
+            stack.append(root)
+            onstack.add(root)
+            work = [(root, iter(eps_adj[root]))]
+            while work:
+                state, successors = work[-1]
+                for tns in successors:
+                    if tns not in index:
+                        index[tns] = lowlink[tns] = len(index)
+                        stack.append(tns)
+                        onstack.add(tns)
+                        work.append((tns, iter(eps_adj[tns])))
+                        break
+                    if tns in onstack:
+                        lowlink[state] = min(lowlink[state], index[tns])
+                else:
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        lowlink[parent] = min(lowlink[parent], lowlink[state])
+                    if lowlink[state] == index[state]:
+                        component = []
+                        while True:
+                            member = stack.pop()
+                            onstack.discard(member)
+                            component.append(member)
+                            if member == state:
+                                break
+                        # components are emitted successors first, so every e-edge
+                        # leaving this one points at a closure that is already known
+                        closure = set(component)
+                        for member in component:
+                            for tns in eps_adj[member]:
+                                if tns in eclosure:
+                                    closure |= eclosure[tns]
+                        closure = frozenset(closure)
+                        for member in component:
+                            eclosure[member] = closure
+        self._eclosure = eclosure
+
     def getEClose(self, findstate):
-        allstates = set()
-        states = set([findstate])
-        while len(states)!= 0:
-            state = states.pop()
-            allstates.add(state)
-            if state in self.transitions:
-                for tns in self.transitions[state]:
-                    if Automata.epsilon() in self.transitions[state][tns] and tns not in allstates:
-                        states.add(tns)
+        if findstate not in self._eclosure:
+            self._eclosure[findstate] = frozenset(self._computeEClose(findstate))
+        return self._eclosure[findstate]
+
+    def _computeEClose(self, findstate):
+        if self.eps_adj is None:
+            self.precompute_epsadj()
+        eps_adj = self.eps_adj
+        allstates = set([findstate])
+        states = [findstate]
+        while states:
+            for tns in eps_adj.get(states.pop(), ()):
+                if tns not in allstates:
+                    allstates.add(tns)
+                    states.append(tns)
         return allstates
 
     def display(self):
         print("states:", self.states)
         print("start state: ", self.startstate)
-        print("final states:", self.finalstates)
+        print("final states:", sorted(self.finalstates))
         print("transitions:")
         for fromstate, tostates in self.transitions.items():
             for state in tostates:
@@ -80,18 +406,18 @@ class Automata:
             print()
 
     def getPrintText(self):
-        text = "language: {" + ", ".join(self.language) + "}\n"
-        text += "states: {" + ", ".join(map(str,self.states)) + "}\n"
-        text += "start state: " + str(self.startstate) + "\n"
-        text += "final states: {" + ", ".join(map(str,self.finalstates)) + "}\n"
-        text += "transitions:\n"
-        linecount = 5
+        lines = [
+            "language: {" + ", ".join(self.language) + "}",
+            "states: {" + ", ".join(map(str,self.states)) + "}",
+            f"start state: {self.startstate}",
+            "final states: {" + ", ".join(map(str,sorted(self.finalstates))) + "}",
+            "transitions:",
+        ]
         for fromstate, tostates in self.transitions.items():
-            for state in tostates:
-                for char in tostates[state]:
-                    text += "    " + str(fromstate) + " -> " + str(state) + " on '" + char + "'\n"
-                    linecount +=1
-        return [text, linecount]
+            for state, chars in tostates.items():
+                for char in chars:
+                    lines.append(f"    {fromstate} -> {state} on '{char}'")
+        return ["\n".join(lines) + "\n", len(lines)]
 
     def newBuildFromNumber(self, startnum):
         translations = {}
@@ -100,7 +426,8 @@ class Automata:
             startnum += 1
         rebuild = Automata(self.language)
         rebuild.setstartstate(translations[self.startstate])
-        rebuild.addfinalstates(translations[self.finalstates[0]])
+        for s in self.finalstates:
+            rebuild.addfinalstates(translations[s])
         for fromstate, tostates in self.transitions.items():
             for state in tostates:
                 rebuild.addtransition(translations[fromstate], translations[state], tostates[state])
@@ -117,88 +444,87 @@ class Automata:
         return rebuild
 
     def getDotFile(self):
-        dotFile = "digraph DFA {\nrankdir=LR\n"
+        lines = ["digraph DFA {", "rankdir=LR"]
         if len(self.states) != 0:
-            dotFile += "root=s1\nstart [shape=point]\nstart->s%d\n" % self.startstate
+            lines += [f"root=s{self.startstate}", "start [shape=point]", f"start->s{self.startstate}"]
             for state in self.states:
                 if state in self.finalstates:
-                    dotFile += "s%d [shape=doublecircle]\n" % state
+                    lines.append(f"s{state} [shape=doublecircle]")
                 else:
-                    dotFile += "s%d [shape=circle]\n" % state
+                    lines.append(f"s{state} [shape=circle]")
             for fromstate, tostates in self.transitions.items():
-                for state in tostates:
-                    for char in tostates[state]:
-                        dotFile += 's%d->s%d [label="%s"]\n' % (fromstate, state, char)
-        dotFile += "}"
-        return dotFile
+                for state, chars in tostates.items():
+                    for char in chars:
+                        lines.append(f's{fromstate}->s{state} [label="{char}"]')
+        lines.append("}")
+        return "\n".join(lines)
 
 
 class BuildAutomata:
     """class for building e-nfa basic structures"""
 
-    @staticmethod
-    def basicstruct(inp):
-        state1 = 1
-        state2 = 2
-        basic = Automata()
-        basic.setstartstate(state1)
-        basic.addfinalstates(state2)
-        basic.addtransition(1, 2, inp)
-        return basic
-
-    @staticmethod
-    def plusstruct(a, b):
-        [a, m1] = a.newBuildFromNumber(2)
-        [b, m2] = b.newBuildFromNumber(m1)
-        state1 = 1
-        state2 = m2
-        plus = Automata()
-        plus.setstartstate(state1)
-        plus.addfinalstates(state2)
-        plus.addtransition(plus.startstate, a.startstate, Automata.epsilon())
-        plus.addtransition(plus.startstate, b.startstate, Automata.epsilon())
-        plus.addtransition(a.finalstates[0], plus.finalstates[0], Automata.epsilon())
-        plus.addtransition(b.finalstates[0], plus.finalstates[0], Automata.epsilon())
-        plus.addtransition_dict(a.transitions)
-        plus.addtransition_dict(b.transitions)
-        return plus
-
-    @staticmethod
-    def dotstruct(a, b):
-        [a, m1] = a.newBuildFromNumber(1)
-        [b, m2] = b.newBuildFromNumber(m1)
-        state1 = 1
-        state2 = m2-1
-        dot = Automata()
-        dot.setstartstate(state1)
-        dot.addfinalstates(state2)
-        dot.addtransition(a.finalstates[0], b.startstate, Automata.epsilon())
-        dot.addtransition_dict(a.transitions)
-        dot.addtransition_dict(b.transitions)
-        return dot
-
-    @staticmethod
-    def starstruct(a):
-        [a, m1] = a.newBuildFromNumber(2)
-        state1 = 1
-        state2 = m1
-        star = Automata()
-        star.setstartstate(state1)
-        star.addfinalstates(state2)
-        star.addtransition(star.startstate, a.startstate, Automata.epsilon())
-        star.addtransition(star.startstate, star.finalstates[0], Automata.epsilon())
-        star.addtransition(a.finalstates[0], star.finalstates[0], Automata.epsilon())
-        star.addtransition(a.finalstates[0], a.startstate, Automata.epsilon())
-        star.addtransition_dict(a.transitions)
-        return star
-
-    @staticmethod
-    def plusstarstruct(a):
+    # All structures are built into the one automaton self.nfa, taking state ids from a
+    # shared counter, so no structure is ever renumbered. A structure is represented as
+    # [start, final, first, end]: states first..end-1 are the contiguous range it owns.
+
+    def __init__(self):
+        self.nfa = Automata()
+        self.nextstate = 1
+
+    def newstates(self, count):
+        first = self.nextstate
+        self.nextstate += count
+        return first
+
+    def basicstruct(self, inp):
+        state1 = self.newstates(2)
+        state2 = state1 + 1
+        self.nfa.addtransition(state1, state2, inp)
+        return [state1, state2, state1, state2 + 1]
+
+    def plusstruct(self, a, b):
+        state1 = self.newstates(2)
+        state2 = state1 + 1
+        self.nfa.addtransition(state1, a[0], Automata.epsilon())
+        self.nfa.addtransition(state1, b[0], Automata.epsilon())
+        self.nfa.addtransition(a[1], state2, Automata.epsilon())
+        self.nfa.addtransition(b[1], state2, Automata.epsilon())
+        return [state1, state2, min(a[2], b[2]), state2 + 1]
+
+    def dotstruct(self, a, b):
+        self.nfa.addtransition(a[1], b[0], Automata.epsilon())
+        return [a[0], b[1], min(a[2], b[2]), max(a[3], b[3])]
+
+    def starstruct(self, a):
+        state1 = self.newstates(2)
+        state2 = state1 + 1
+        self.nfa.addtransition(state1, a[0], Automata.epsilon())
+        self.nfa.addtransition(state1, state2, Automata.epsilon())
+        self.nfa.addtransition(a[1], state2, Automata.epsilon())
+        self.nfa.addtransition(a[1], a[0], Automata.epsilon())
+        return [state1, state2, a[2], state2 + 1]
+
+    def copystruct(self, a):
+        # a structure's edges stay inside its range until it is combined, so a copy
+        # is its range shifted past the last allocated state
+        offset = self.newstates(a[3] - a[2]) - a[2]
+        for state in range(a[2], a[3]):
+            for tostate, chars in self.nfa.transitions.get(state, {}).items():
+                self.nfa.addtransition(state + offset, tostate + offset, chars)
+        return [a[0] + offset, a[1] + offset, a[2] + offset, a[3] + offset]
+
+    def plusstarstruct(self, a):
         # Implements A+ = A.A*
-        return BuildAutomata.dotstruct(a, BuildAutomata.starstruct(a))
+        return self.dotstruct(a, self.starstruct(self.copystruct(a)))
 
 
 class NFAfromRegex:
+    # character kinds for the parser's dispatch table; 0 marks a symbol that is not allowed
+    ALPHA, OPEN, CLOSE, STAR, PLUS, DOT, PLUSSTAR = range(1, 8)
+    # kinds after which an implicit concatenation is inserted, and kinds an operator may not follow
+    CONCATAFTER = frozenset([ALPHA, CLOSE, STAR, PLUSSTAR])
+    OPERATORS = frozenset([PLUS, DOT, PLUSSTAR])
+
     def __init__(self, regex):
         self.star = '*'
         self.plus = '+'
@@ -208,9 +534,16 @@ class NFAfromRegex:
         self.closingBracket = ')'
         self.operators = [self.plus, self.dot, self.plusstar]
         self.regex = regex
-        self.alphabet = [chr(i) for i in range(65,91)]
-        self.alphabet.extend([chr(i) for i in range(97,123)])
-        self.alphabet.extend([chr(i) for i in range(48,58)])
+        self.alphabet = frozenset([chr(i) for i in range(65,91)] + [chr(i) for i in range(97,123)]
+                                  + [chr(i) for i in range(48,58)])
+        self._kind = bytearray(256)
+        for char in self.alphabet:
+            self._kind[ord(char)] = self.ALPHA
+        for char, kind in [(self.openingBracket, self.OPEN), (self.closingBracket, self.CLOSE), (self.star, self.STAR),
+                           (self.plus, self.PLUS), (self.dot, self.DOT), (self.plusstar, self.PLUSSTAR)]:
+            self._kind[ord(char)] = kind
+        self._handlers = [self._handleInvalid, self._handleAlpha, self._handleOpen, self._handleClose,
+                          self._handleStar, self._handleOperator, self._handleOperator, self._handlePlusstar]
         self.buildNFA()
 
     def getNFA(self):
@@ -220,53 +553,100 @@ class NFAfromRegex:
         self.nfa.display()
 
     def buildNFA(self):
-        language = set()
+        self.language = set()
         self.stack = []
         self.automata = []
-        previous = "::e::"
+        self.builder = BuildAutomata()
+        self.previous = "::e::"
+        self.previouskind = 0
+        kinds = self._kind
+        handlers = self._handlers
         for char in self.regex:
-            if char in self.alphabet:
-                language.add(char)
-                if previous != self.dot and (previous in self.alphabet or previous in [self.closingBracket,self.star,self.plusstar]):
-                    self.addOperatorToStack(self.dot)
-                self.automata.append(BuildAutomata.basicstruct(char))
-            elif char == self.openingBracket:
-                if previous != self.dot and (previous in self.alphabet or previous in [self.closingBracket,self.star,self.plusstar]):
-                    self.addOperatorToStack(self.dot)
-                self.stack.append(char)
-            elif char == self.closingBracket:
-                if previous in self.operators:
-                    raise BaseException(f"Error processing '{char}' after '{previous}'")
-                while True:
-                    if len(self.stack) == 0:
-                        raise BaseException(f"Error processing '{char}'. Empty stack")
-                    o = self.stack.pop()
-                    if o == self.openingBracket:
-                        break
-                    elif o in self.operators:
-                        self.processOperator(o)
-            elif char == self.star:
-                if previous in self.operators or previous in [self.openingBracket, self.star]:
-                    raise BaseException(f"Error processing '{char}' after '{previous}'")
-                self.processOperator(char)
-            elif char == self.plusstar:
-                if previous in self.operators or previous in [self.openingBracket, self.plusstar]:
-                    raise BaseException(f"Error processing '{char}' after '{previous}'")
-                self.processOperator(char)
-            elif char in self.operators:
-                if previous in self.operators or previous == self.openingBracket:
-                    raise BaseException(f"Error processing '{char}' after '{previous}'")
-                self.addOperatorToStack(char)
-            else:
-                raise BaseException(f"Symbol '{char}' is not allowed")
-            previous = char
+            code = ord(char)
+            kind = kinds[code] if code < 256 else 0
+            handlers[kind](char)
+            self.previous = char
+            self.previouskind = kind
         while len(self.stack) != 0:
             op = self.stack.pop()
             self.processOperator(op)
         if len(self.automata) > 1:
             raise BaseException("Regex could not be parsed successfully")
-        self.nfa = self.automata.pop()
-        self.nfa.language = language
+        [start, final, _, _] = self.automata.pop()
+        self.nfa = self.builder.nfa
+        self.nfa.setstartstate(start)
+        self.nfa.addfinalstates(final)
+        self.nfa.language = self.language
+        self.nfa.freeze()
+        self.compile_simulator()
+
+    def _raiseAfterPrevious(self, char):
+        raise BaseException(f"Error processing '{char}' after '{self.previous}'")
+
+    def _handleInvalid(self, char):
+        raise BaseException(f"Symbol '{char}' is not allowed")
+
+    def _handleAlpha(self, char):
+        self.language.add(char)
+        if self.previouskind in self.CONCATAFTER:
+            self.addOperatorToStack(self.dot)
+        self.automata.append(self.builder.basicstruct(char))
+
+    def _handleOpen(self, char):
+        if self.previouskind in self.CONCATAFTER:
+            self.addOperatorToStack(self.dot)
+        self.stack.append(char)
+
+    def _handleClose(self, char):
+        if self.previouskind in self.OPERATORS:
+            self._raiseAfterPrevious(char)
+        while True:
+            if len(self.stack) == 0:
+                raise BaseException(f"Error processing '{char}'. Empty stack")
+            o = self.stack.pop()
+            if o == self.openingBracket:
+                break
+            elif o in self.operators:
+                self.processOperator(o)
+
+    def _handleStar(self, char):
+        if self.previouskind in self.OPERATORS or self.previouskind in (self.OPEN, self.STAR):
+            self._raiseAfterPrevious(char)
+        self.processOperator(char)
+
+    def _handlePlusstar(self, char):
+        if self.previouskind in self.OPERATORS or self.previouskind == self.OPEN:
+            self._raiseAfterPrevious(char)
+        self.processOperator(char)
+
+    def _handleOperator(self, char):
+        if self.previouskind in self.OPERATORS or self.previouskind == self.OPEN:
+            self._raiseAfterPrevious(char)
+        self.addOperatorToStack(char)
+
+    def compile_simulator(self, limit=Automata.DFA_LIMIT):
+        """generates and execs an accepts() specialised to this NFA, with its DFA hardcoded as a table
+        literal; nothing is compiled if the DFA has more than limit states"""
+        dfa = self.nfa.subsetdfa(limit)
+        if dfa is None:
+            return
+        [rows, accepting] = dfa
+        rows = ["    {" + ", ".join("%r: %d" % item for item in row.items()) + "}," for row in rows]
+        accepting = map(str, accepting)
+        source = "\n".join(["TABLE = ("] + rows + [
+            ")",
+            "FINALS = frozenset([" + ", ".join(accepting) + "])",
+            "def accepts(string, table=TABLE, finals=FINALS):",
+            "    state = 0",
+            "    for char in string:",
+            "        state = table[state].get(char)",
+            "        if state is None:",
+            "            return False",
+            "    return state in finals",
+        ])
+        namespace = {}
+        exec(compile(source, "<NFA %s>" % self.regex, "exec"), namespace)
+        self.nfa.simulator = namespace["accepts"]
 
     def addOperatorToStack(self, char):
         while len(self.stack) > 0:
@@ -285,32 +665,25 @@ class NFAfromRegex:
             raise BaseException(f"Error processing operator '{operator}'. Stack is empty")
         if operator == self.star:
             a = self.automata.pop()
-            self.automata.append(BuildAutomata.starstruct(a))
+            self.automata.append(self.builder.starstruct(a))
         elif operator == self.plusstar:
             a = self.automata.pop()
-            self.automata.append(BuildAutomata.plusstarstruct(a))
+            self.automata.append(self.builder.plusstarstruct(a))
         elif operator in self.operators:
             if len(self.automata) < 2:
                 raise BaseException(f"Error processing operator '{operator}'. Inadequate operands")
             a = self.automata.pop()
             b = self.automata.pop()
             if operator == self.plus:
-                self.automata.append(BuildAutomata.plusstruct(b, a))
+                self.automata.append(self.builder.plusstruct(b, a))
             elif operator == self.dot:
-                self.automata.append(BuildAutomata.dotstruct(b, a))
+                self.automata.append(self.builder.dotstruct(b, a))
 
 
 def drawGraph(automata, file = ""):
-    f = popen(r"dot -Tpng -o graph%s.png" % file, 'w')
-    try:
-        f.write(automata.getDotFile())
-    except:
-        raise BaseException("Error creating graph")
-    finally:
-        f.close()
+    dot = automata.getDotFile().encode()
+    subprocess.run(["dot", "-Tpng", "-o", f"graph{file}.png"], input=dot, check=True)
 
 
 def isInstalled(program):
-    path = shutil.which(program)
-    print(f"DEBUG: dot path = {path}")
-    return path is not None
+    return shutil.which(program) is not None
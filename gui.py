@@ -1,8 +1,10 @@
 import sys
 import time
+from collections import defaultdict
 
 try:
     from tkinter import *
+    from tkinter import filedialog
     from tkinter import font as tkFont
     from tkinter import ttk
 except ImportError:
@@ -13,22 +15,7 @@ from AutomataTheory import *
 
 
 def simulate_nfa(nfa, input_string):
-    def dfs(states, index):
-        if index == len(input_string):
-            return any(s in nfa.finalstates for state in states for s in nfa.getEClose(state))
-
-        symbol = input_string[index]
-        next_states = set()
-
-        for state in states:
-            for s in nfa.getEClose(state):
-                for t in nfa.gettransitions(s, symbol):
-                    next_states.update(nfa.getEClose(t))
-
-        return dfs(next_states, index + 1)
-
-    start_states = nfa.getEClose(nfa.startstate)
-    return dfs(start_states, 0)
+    return nfa.accepts(input_string)
 
 
 class AutomataGUI:
@@ -71,6 +58,7 @@ class AutomataGUI:
         self.testStringField = Entry(testStringFrame, width=80, textvariable=self.testVar)
         self.testStringField.grid(row=1, column=0, sticky=W)
         Button(testStringFrame, text="Test", width=10, command=self.handleTestStringButton).grid(row=1, column=1, padx=5)
+        Button(testStringFrame, text="Test File", width=10, command=self.handleTestFileButton).grid(row=1, column=2, padx=5)
 
         self.statusLabel = Label(parentFrame)
 
@@ -129,10 +117,7 @@ class AutomataGUI:
             self.statusLabel.config(text="Please build the automaton first.")
             return
 
-        if input_str == "":
-            result = any(s in self.nfa.finalstates for s in self.nfa.getEClose(self.nfa.startstate))
-        else:
-            result = simulate_nfa(self.nfa, input_str)
+        result = simulate_nfa(self.nfa, input_str)
 
         if result:
             self.statusLabel.config(text=" Accepts!")
@@ -141,6 +126,27 @@ class AutomataGUI:
 
         self.timingLabel.configure(text="Test completed in %.4f seconds" % (time.time() - t))
 
+    def handleTestFileButton(self):
+        if not hasattr(self, 'nfa'):
+            self.statusLabel.config(text="Please build the automaton first.")
+            return
+
+        filename = filedialog.askopenfilename(title="Select a file with one test string per line")
+        if not filename:
+            return
+
+        t = time.time()
+        try:
+            with open(filename) as f:
+                strings = [s for s in (line.strip() for line in f) if s]
+        except (OSError, UnicodeDecodeError) as e:
+            self.statusLabel.config(text=f"Could not read test file: {e}")
+            return
+
+        results = self.nfa.accepts_many(strings)
+        self.statusLabel.config(text=f" Accepts {sum(results)} of {len(results)} strings (blank lines skipped).")
+        self.timingLabel.configure(text="Test completed in %.4f seconds" % (time.time() - t))
+
     def handlenfaButton(self):
         if not hasattr(self, 'nfa'):
             self.statusLabel.config(text="Please build the automaton first.")
@@ -161,11 +167,8 @@ class AutomataGUI:
         tree.heading("To", text="To State", anchor=CENTER)
         tree.heading("Symbol", text="Symbol", anchor=CENTER)
 
-        for from_state in self.nfa.transitions:
-            for to_state in self.nfa.transitions[from_state]:
-                symbols = self.nfa.transitions[from_state][to_state]
-                for symbol in symbols:
-                    tree.insert("", "end", values=(from_state, to_state, symbol))
+        for from_state, to_state, symbol in self.nfa.getedges():
+            tree.insert("", "end", values=(from_state, to_state, symbol))
 
         tree.pack(expand=True, fill=BOTH)
 
@@ -200,17 +203,17 @@ class AutomataGUI:
         for col, text in enumerate(columns):
             Label(frame, text=text, font=("Courier", 12, "bold"), borderwidth=1, relief="solid", width=10).grid(row=0, column=col)
 
+        cells = defaultdict(lambda: defaultdict(list))
+        for from_state, to_state, symbol in self.nfa.getedges():
+            cells[from_state][symbol].append(str(to_state))
+
         states = sorted(self.nfa.states)
         for i, state in enumerate(states, start=1):
             Label(frame, text=str(state), font=("Courier", 12), borderwidth=1, relief="solid", width=10).grid(row=i, column=0)
 
+            row = cells.get(state, {})
             for j, symbol in enumerate(["0", "1", self.nfa.epsilon()], start=1):
-                targets = []
-                for to_state in self.nfa.transitions.get(state, {}):
-                    symbols = self.nfa.transitions[state][to_state]
-                    if symbol in symbols:
-                        targets.append(str(to_state))
-                cell_value = ",".join(sorted(targets)) if targets else "--"
+                cell_value = ",".join(sorted(row.get(symbol, []))) or "--"
                 Label(frame, text=cell_value, font=("Courier", 12), borderwidth=1, relief="solid", width=10).grid(row=i, column=j)
 
     def createAutomata(self, inp):